@@ -2,7 +2,10 @@ import os
 from werkzeug.utils import secure_filename
 from flask import Flask, render_template, request, redirect, session, url_for, flash, jsonify
 from collections import defaultdict
-import hashlib, json, secrets, math
+import hashlib, json, secrets, math, time
+from functools import lru_cache
+import click
+import numpy as np
 from datetime import datetime, timedelta
 import pytz
 from flask_sqlalchemy import SQLAlchemy
@@ -10,6 +13,8 @@ from flask_admin import Admin, AdminIndexView
 from flask_admin.contrib.sqla import ModelView
 from flask_migrate import Migrate
 from sqlalchemy import exc as sa_exc
+from sqlalchemy import event, and_, or_
+from sqlalchemy.orm import selectinload
 from PIL import Image
 import base64
 import requests
@@ -23,7 +28,16 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 UPLOAD_FOLDER = os.path.join(app.root_path, 'static', 'profile_pics')
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+
+def include_object(obj, name, type_, reflected, compare_to):
+    # Suchindex (FTS5-Tabellen bzw. Postgres-Indizes) wird in der Migration von Hand angelegt
+    if type_ == 'table' and name.startswith('user_search'):
+        return False
+    if type_ == 'index' and (name.endswith('_trgm') or name == 'ix_users_username_lower_c'):
+        return False
+    return True
+
+migrate = Migrate(app, db, include_object=include_object)
 
 # Github Configuration (für Backups)
 app.config['GITHUB_TOKEN'] = os.environ.get('GITHUB_TOKEN')
@@ -67,8 +81,11 @@ class UserStat(db.Model):
     attr_endurance = db.Column(db.Integer, default=0)
     attr_intelligence = db.Column(db.Integer, default=0)
     coins = db.Column(db.Integer, default=0)  # Neu: Virtuelle Währung für Shop
+    sync_seq = db.Column(db.BigInteger)
     user = db.relationship('User', back_populates='stats')
 
+    __table_args__ = (db.Index('ix_user_stats_user_sync', 'user_id', 'sync_seq'),)
+
 class Workout(db.Model):
     __tablename__ = 'workouts'
     id = db.Column(db.Integer, primary_key=True)
@@ -76,9 +93,16 @@ class Workout(db.Model):
     exercise = db.Column(db.Text)
     date = db.Column(db.Text)
     type = db.Column(db.Text)  # 'strength', 'cardio', 'calisthenics', 'restday'
+    sync_seq = db.Column(db.BigInteger)
 
     user = db.relationship('User', back_populates='workouts')
-    sets = db.relationship('Set', back_populates='workout', lazy=True, cascade="all, delete-orphan")
+    sets = db.relationship('Set', back_populates='workout', lazy=True, cascade="all, delete-orphan", order_by='Set.id')
+
+    __table_args__ = (
+        db.Index('ix_workouts_user_sync', 'user_id', 'sync_seq'),
+        db.Index('ix_workouts_user_date_id', 'user_id', 'date', 'id'),
+        {'sqlite_autoincrement': True},  # keine IDs gelöschter Zeilen neu vergeben (Sync, Ledger)
+    )
 
 class Set(db.Model):
     __tablename__ = 'sets'
@@ -87,10 +111,13 @@ class Set(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'))
     reps = db.Column(db.Integer, nullable=False)
     weight = db.Column(db.Float, nullable=False)
+    sync_seq = db.Column(db.BigInteger)
 
     user = db.relationship('User', back_populates='sets')
     workout = db.relationship('Workout', back_populates='sets')
 
+    __table_args__ = (db.Index('ix_sets_user_sync', 'user_id', 'sync_seq'), {'sqlite_autoincrement': True})
+
 class Notification(db.Model):
     __tablename__ = 'notifications'
     id = db.Column(db.Integer, primary_key=True)
@@ -100,6 +127,9 @@ class Notification(db.Model):
     type = db.Column(db.Text, default='patchnote')
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sync_seq = db.Column(db.BigInteger)
+
+    __table_args__ = (db.Index('ix_notifications_user_sync', 'user_id', 'sync_seq'), {'sqlite_autoincrement': True})
 
 class Patchnote(db.Model):
     __tablename__ = 'patchnotes'
@@ -117,6 +147,48 @@ class ShopItem(db.Model):
     price = db.Column(db.Integer, nullable=False)
     effect = db.Column(db.Text)  # z.B. 'xp_boost_50'
 
+class XpLedger(db.Model):
+    # Eine Zeile pro Vergabe (Workout, Shop, Rückbuchung, Neuberechnung)
+    __tablename__ = 'xp_ledger'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    workout_id = db.Column(db.Integer, index=True)  # kein FK, Einträge bleiben nach dem Löschen erhalten
+    source = db.Column(db.Text, nullable=False)  # 'workout', 'reversal', 'shop', 'rescore', 'opening'
+    xp = db.Column(db.Integer, default=0)
+    coins = db.Column(db.Integer, default=0)
+    attr_strength = db.Column(db.Integer, default=0)
+    attr_endurance = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# --- Sync (Offline-Clients) ---
+class SyncState(db.Model):
+    # Eine einzige Zeile mit dem globalen Änderungszähler für /api/sync
+    __tablename__ = 'sync_state'
+    id = db.Column(db.Integer, primary_key=True)
+    seq = db.Column(db.BigInteger, nullable=False, default=0)
+
+class SyncTombstone(db.Model):
+    # Merkt sich gelöschte Zeilen, damit Clients sie lokal entfernen können
+    __tablename__ = 'sync_tombstones'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'))
+    table_name = db.Column(db.Text, nullable=False)
+    row_id = db.Column(db.Integer, nullable=False)
+    sync_seq = db.Column(db.BigInteger, nullable=False)
+
+    __table_args__ = (db.Index('ix_sync_tombstones_user_sync', 'user_id', 'sync_seq'),)
+
+class SyncOperation(db.Model):
+    # Bereits ausgeführte Client-Operationen (Idempotency-Keys)
+    __tablename__ = 'sync_operations'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    key = db.Column(db.Text, nullable=False)
+    result = db.Column(db.Text, nullable=False)  # JSON
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('user_id', 'key', name='uq_sync_operations_user_key'),)
+
 # Admin Setup
 class MyAdminIndexView(AdminIndexView):
     def is_accessible(self):
@@ -131,6 +203,7 @@ admin.add_view(ModelView(Set, db.session))
 admin.add_view(ModelView(Notification, db.session))
 admin.add_view(ModelView(Patchnote, db.session))
 admin.add_view(ModelView(ShopItem, db.session))
+admin.add_view(ModelView(XpLedger, db.session))
 
 # Helper Functions
 def hash_password(password):
@@ -155,56 +228,636 @@ def get_rank_name(level):
     elif level <= 45: return "Leistungssportler"
     else: return "Sport ist Leben"
 
-def update_streak(user_id, date, is_restday=False):
+def user_streak(user_id, before=None):
+    # Streak nach dem letzten eingetragenen Tag (vor `before`), nach derselben Regel wie
+    # score_workouts: ein Tag direkt nach einem Trainingstag setzt die Folge fort, ein
+    # Ruhetag beendet sie. Gezählt werden die Trainingstage der Folge, unabhängig davon,
+    # wie viele Workouts pro Tag eingetragen sind.
+    days = (db.session.query(Workout.date, db.func.max(db.case((Workout.type != 'restday', 1), else_=0)))
+            .filter(Workout.user_id == user_id)
+            .group_by(Workout.date)
+            .order_by(Workout.date.desc()))
+    if before is not None:
+        days = days.filter(Workout.date < before)
+    streak, newer = 0, None
+    for day, trained in days:
+        day = datetime.strptime(day, "%Y-%m-%d").date()
+        if newer is not None and not (trained and (newer - day).days == 1):
+            break
+        streak += trained
+        newer = day
+    return streak
+
+def update_streak(user_id, commit=True):
     user_stats = UserStat.query.filter_by(user_id=user_id).first()
+    user_stats.streak_days = user_streak(user_id)
+    if commit:
+        db.session.commit()
+
+# XP-Formeln an einer Stelle: calculate_xp rechnet mit Einzelwerten,
+# rescore_stats mit NumPy-Arrays über alle Workouts
+WORKOUT_ATTRS = {'strength': 'attr_strength', 'cardio': 'attr_endurance', 'calisthenics': 'attr_endurance'}
+
+def streak_bonus(streak_days):
+    return np.where(streak_days < 3, 0, streak_days * 10)
+
+def workout_xp(w_type, volume, reps_total, first_reps, first_weight, bonus):
+    # Cardio: erster Satz = Dauer (reps) und Distanz (weight)
+    xp = np.select([w_type == 'strength', w_type == 'cardio', w_type == 'calisthenics'],
+                   [volume / 10 + bonus, first_reps * 2 + first_weight * 10 + bonus, reps_total * 1.5 + bonus],
+                   0)
+    return np.trunc(xp).astype(np.int64)
+
+def sets_xp(w_type, sets, bonus=0):
+    first = sets[0] if sets else None
+    return int(workout_xp(w_type, sum(s.weight * s.reps for s in sets), sum(s.reps for s in sets),
+                          first.reps if first else 0, first.weight if first else 0, bonus))
+
+def notify_level_up(user_id, old_xp, new_xp):
+    old_level, _, _ = calculate_level(old_xp)
+    new_level, _, _ = calculate_level(new_xp)
+    if new_level > old_level:
+        notif = Notification(user_id=user_id, title="Level Up!", content=f"Du bist jetzt Level {new_level}!")
+        db.session.add(notif)
+
+def calculate_xp(workout, sets, commit=True):
+    stats = workout.user.stats
+    # Bonus aus dem Streak vor dem Workout-Datum, gleicher Wert für alle Workouts eines Tages
+    xp = sets_xp(workout.type, sets, streak_bonus(user_streak(workout.user_id, before=workout.date)))
+    attr = WORKOUT_ATTRS.get(workout.type)
+    if attr:
+        setattr(stats, attr, getattr(stats, attr) + 1)
+    stats.xp_total += xp
+    stats.coins += 10  # +10 Coins pro Workout
+    db.session.add(XpLedger(user_id=workout.user_id, workout_id=workout.id, source='workout', xp=xp, coins=10,
+                            attr_strength=int(attr == 'attr_strength'), attr_endurance=int(attr == 'attr_endurance')))
+    notify_level_up(workout.user_id, stats.xp_total - xp, stats.xp_total)
+    if commit:
+        db.session.commit()
+    return xp
+
+def add_workout_sets(workout, sets_data, commit=True):
+    # Nachgetragene Sätze bekommen die XP-Differenz gutgeschrieben. Der Streak-Bonus
+    # wurde beim Anlegen vergeben und bleibt gleich, also reicht die Differenz ohne Bonus.
+    sets_data = validate_sets(sets_data)
+    xp_before = sets_xp(workout.type, workout.sets)
+    new_sets = [Set(user_id=workout.user_id, reps=reps, weight=weight) for reps, weight in sets_data]
+    workout.sets.extend(new_sets)
+    db.session.flush()
+    xp = sets_xp(workout.type, workout.sets) - xp_before
+    if xp:
+        stats = workout.user.stats
+        stats.xp_total += xp
+        db.session.add(XpLedger(user_id=workout.user_id, workout_id=workout.id, source='workout', xp=xp))
+        notify_level_up(workout.user_id, stats.xp_total - xp, stats.xp_total)
+    if commit:
+        db.session.commit()
+    return new_sets, xp
+
+def reverse_workout_xp(workout):
+    # Bucht alles zurück, was der Ledger für dieses Workout verzeichnet
+    xp, coins, strength, endurance = db.session.query(
+        db.func.coalesce(db.func.sum(XpLedger.xp), 0), db.func.coalesce(db.func.sum(XpLedger.coins), 0),
+        db.func.coalesce(db.func.sum(XpLedger.attr_strength), 0),
+        db.func.coalesce(db.func.sum(XpLedger.attr_endurance), 0)
+    ).filter(XpLedger.workout_id == workout.id).one()
+    if not (xp or coins or strength or endurance):
+        return
+    stats = workout.user.stats
+    coins = min(coins, stats.coins)  # bereits ausgegebene Coins nicht ins Minus buchen
+    stats.xp_total -= xp
+    stats.coins -= coins
+    stats.attr_strength -= strength
+    stats.attr_endurance -= endurance
+    db.session.add(XpLedger(user_id=workout.user_id, workout_id=workout.id, source='reversal', xp=-xp,
+                            coins=-coins, attr_strength=-strength, attr_endurance=-endurance))
+
+def rescore_later_days(user_id, date):
+    # Ein nachgetragener oder gelöschter Tag ändert den Streak-Bonus der Workouts danach.
+    # Diese werden wie bei flask rescore neu bewertet und pro Workout gebucht.
+    if not Workout.query.filter(Workout.user_id == user_id, Workout.date > date).first():
+        return
+    db.session.flush()
+    rescore_chunk(user_id, user_id, dry_run=False, commit=False)
+    stats = db.session.get(UserStat, user_id)
+    if stats is not None:
+        db.session.expire(stats)  # per Bulk-Update geändert
+
+def validate_date(date):
+    # Nur YYYY-MM-DD, sonst stimmt die Sortierung über die Text-Spalte nicht
+    try:
+        valid = datetime.strptime(date, "%Y-%m-%d").strftime("%Y-%m-%d") == date
+    except (TypeError, ValueError):
+        valid = False
+    if not valid:
+        raise ValueError('Ungültiges Datum')
+
+def validate_sets(sets_data):
+    # Formular liefert Strings, die Sync-API Zahlen
+    if not isinstance(sets_data, list):
+        raise ValueError('Ungültige Sätze')
+    sets = []
+    for s in sets_data:
+        try:
+            reps = float(s['reps'])
+            weight = float(s['weight'])
+        except (TypeError, ValueError, KeyError):
+            raise ValueError('Ungültige Sätze')
+        if not (math.isfinite(reps) and math.isfinite(weight)) or reps < 0 or weight < 0 or reps != int(reps):
+            raise ValueError('Ungültige Sätze')
+        sets.append((int(reps), weight))
+    return sets
+
+def create_workout(user_id, exercise, date, w_type, sets_data, commit=True):
+    if not exercise or not date or not w_type:
+        raise ValueError('Alle Felder ausfüllen')
+    if not isinstance(exercise, str):
+        raise ValueError('Ungültige Übung')
+    if not isinstance(w_type, str) or w_type not in WORKOUT_ATTRS:  # Ruhetage nur über create_restday
+        raise ValueError('Ungültiger Workout-Typ')
+    validate_date(date)
+    sets_data = validate_sets(sets_data)
+    if Workout.query.filter_by(user_id=user_id, date=date, exercise=exercise).first():
+        raise ValueError('Workout bereits eingetragen')
+    workout = Workout(user_id=user_id, exercise=exercise, date=date, type=w_type)
+    db.session.add(workout)
+    db.session.flush()
+    for reps, weight in sets_data:
+        new_set = Set(workout_id=workout.id, user_id=user_id, reps=reps, weight=weight)
+        db.session.add(new_set)
+    db.session.flush()
+    xp = calculate_xp(workout, workout.sets, commit=commit)
+    rescore_later_days(user_id, date)
+    update_streak(user_id, commit=commit)
+    return workout, xp
+
+def create_restday(user_id, date, commit=True):
+    validate_date(date)
+    if Workout.query.filter_by(user_id=user_id, date=date).first():
+        raise ValueError('Datum hat bereits ein Workout')
     today = datetime.now(pytz.utc).date()
     yesterday = today - timedelta(days=1)
     day_before = today - timedelta(days=2)
     yesterday_date = yesterday.strftime("%Y-%m-%d")
     day_before_date = day_before.strftime("%Y-%m-%d")
-
     yesterday_workout = Workout.query.filter_by(user_id=user_id, date=yesterday_date).first()
     day_before_workout = Workout.query.filter_by(user_id=user_id, date=day_before_date).first()
     yesterday_restday = yesterday_workout and yesterday_workout.exercise == 'Restday'
+    if day_before_workout and yesterday_workout and not yesterday_restday:
+        workout = Workout(user_id=user_id, exercise='Restday', date=date, type='restday')
+        db.session.add(workout)
+        db.session.flush()
+        rescore_later_days(user_id, date)
+        update_streak(user_id, commit=commit)
+        return workout
+    elif not day_before_workout or not yesterday_workout:
+        raise ValueError('Ruhetag nur nach mindestens 2 Trainings möglich')
+    elif yesterday_restday:
+        raise ValueError('Keine zwei Ruhetage in Folge')
+    else:
+        raise ValueError('Ruhetag nicht verfügbar')
+
+def remove_workout(user_id, workout_id, commit=True):
+    workout = Workout.query.get(workout_id)
+    if not workout or workout.user_id != user_id:
+        return False
+    reverse_workout_xp(workout)
+    db.session.delete(workout)
+    db.session.flush()
+    rescore_later_days(user_id, workout.date)
+    update_streak(user_id, commit=commit)
+    return True
 
-    if yesterday_workout and not yesterday_restday:
-        user_stats.streak_days += 1
-    elif is_restday and day_before_workout and yesterday_workout and not yesterday_restday:
-        pass  # Restday erlaubt, Streak behalten
+def workout_to_dict(workout):
+    workout_data = {
+        "id": workout.id,
+        "exercise": workout.exercise,
+        "type": workout.type
+    }
+    if workout.type == "cardio":
+        if workout.sets:
+            cardio_set = workout.sets[0]
+            workout_data["duration"] = cardio_set.reps
+            workout_data["distance"] = cardio_set.weight
+        else:
+            workout_data["duration"] = 0
+            workout_data["distance"] = 0
+    elif workout.type == "calisthenics":
+        workout_data["sets"] = [{"reps": s.reps, "weight": s.weight} for s in workout.sets]
+        workout_data["bodyweight"] = workout.sets[0].weight if workout.sets else 0
     else:
-        user_stats.streak_days = 1 if not is_restday else 0
-    db.session.commit()
+        workout_data["sets"] = [{"reps": s.reps, "weight": s.weight} for s in workout.sets]
+    return workout_data
 
-def calculate_xp(workout, sets):
-    xp = 0
-    bonus = 0 if workout.user.stats.streak_days < 3 else workout.user.stats.streak_days * 10
-    if workout.type == 'strength':
-        volume = sum(s.weight * s.reps for s in sets)
-        xp = volume / 10 + bonus
-        workout.user.stats.attr_strength += 1
-    elif workout.type == 'cardio':
-        duration = sets[0].reps if sets else 0
-        distance = sets[0].weight if sets else 0
-        xp = (duration * 2 + distance * 10) + bonus
-        workout.user.stats.attr_endurance += 1
-    elif workout.type == 'calisthenics':
-        reps_total = sum(s.reps for s in sets)
-        xp = reps_total * 1.5 + bonus
-        workout.user.stats.attr_endurance += 1
-    elif workout.type == 'restday':
-        xp = 0
-    workout.user.stats.xp_total += int(xp)
-    workout.user.stats.coins += 10  # +10 Coins pro Workout
-    old_level, _, _ = calculate_level(workout.user.stats.xp_total - int(xp))
-    new_level, _, _ = calculate_level(workout.user.stats.xp_total)
-    if new_level > old_level:
-        notif = Notification(user_id=workout.user_id, title="Level Up!", content=f"Du bist jetzt Level {new_level}!")
-        db.session.add(notif)
+# --- History Helpers ---
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 100
+
+def parse_history_cursor(cursor):
+    # Cursor = "<datum>:<id>" des letzten Workouts der vorherigen Seite
+    if not cursor:
+        return None
+    date, _, workout_id = cursor.rpartition(':')
+    try:
+        datetime.strptime(date, "%Y-%m-%d")
+        return date, int(workout_id)
+    except ValueError:
+        raise ValueError('Ungültiger Cursor')
+
+def get_workout_history(user_id, cursor=None, limit=HISTORY_PAGE_SIZE, w_type=None, exercise=None):
+    # Keyset-Pagination über (date, id) statt OFFSET: jede Seite ist ein
+    # Index-Range-Scan auf ix_workouts_user_date_id, egal wie weit zurück
+    query = Workout.query.filter(Workout.user_id == user_id)
+    if w_type:
+        query = query.filter(Workout.type == w_type)
+    if exercise:
+        query = query.filter(Workout.exercise == exercise)
+    after = parse_history_cursor(cursor)
+    if after:
+        date, workout_id = after
+        query = query.filter(or_(Workout.date < date, and_(Workout.date == date, Workout.id < workout_id)))
+    workouts = (query.options(selectinload(Workout.sets))
+                .order_by(Workout.date.desc(), Workout.id.desc())
+                .limit(limit + 1).all())
+    next_cursor = None
+    if len(workouts) > limit:
+        workouts = workouts[:limit]
+        next_cursor = f"{workouts[-1].date}:{workouts[-1].id}"
+    return workouts, next_cursor
+
+# --- User Search ---
+# SQLite: FTS5-Tabelle mit Präfix-Index, wird bei register/update_profile gepflegt.
+# Postgres: pg_trgm-GIN-Indizes direkt auf users.username und user_profile.name.
+USER_SEARCH_LIMIT = 10
+USER_SEARCH_CANDIDATES = 200  # SQLite: nur so viele Treffer nach bm25 sortieren
+USER_SEARCH_MAX_QUERY = 50
+USER_SEARCH_CACHE_SECONDS = 60
+USER_SEARCH_TRIGRAM_MIN = 3  # pg_trgm kann kürzere Präfixe nicht über den Index eingrenzen
+
+def is_sqlite():
+    return db.engine.dialect.name == 'sqlite'
+
+def ensure_user_search_index():
+    if is_sqlite():
+        db.session.execute(db.text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS user_search "
+            "USING fts5(username, name, tokenize='unicode61', prefix='1 2 3')"))
+    else:
+        db.session.execute(db.text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        db.session.execute(db.text(
+            "CREATE INDEX IF NOT EXISTS ix_users_username_trgm ON users USING gin (username gin_trgm_ops)"))
+        db.session.execute(db.text(
+            "CREATE INDEX IF NOT EXISTS ix_user_profile_name_trgm ON user_profile USING gin (name gin_trgm_ops)"))
+        db.session.execute(db.text(
+            'CREATE INDEX IF NOT EXISTS ix_users_username_lower_c ON users (lower(username) COLLATE "C")'))
     db.session.commit()
-    return int(xp)
+
+def index_user_search(user_id, username, name):
+    # Läuft in der Transaktion des Aufrufers, damit Index und Profil gemeinsam committen
+    if is_sqlite():
+        db.session.execute(db.text("DELETE FROM user_search WHERE rowid = :id"), {"id": user_id})
+        db.session.execute(db.text("INSERT INTO user_search (rowid, username, name) VALUES (:id, :username, :name)"),
+                           {"id": user_id, "username": username, "name": name or ''})
+    search_users_cached.cache_clear()
+
+def search_users_sqlite(query):
+    # Jedes Wort als Präfix-Phrase, z.B. "ten"* "to"*; Anführungszeichen verdoppeln
+    match = ' '.join('"' + word.replace('"', '""') + '"*' for word in query.split())
+    # ORDER BY rank allein berechnet bm25 für jeden Treffer, bei "m" ein Großteil aller
+    # User. In rowid-Reihenfolge bricht FTS5 nach den Kandidaten ab, nur diese werden sortiert.
+    rows = db.session.execute(db.text(
+        "SELECT u.username, p.name, p.profile_pic FROM "
+        "(SELECT rowid, rank FROM user_search WHERE user_search MATCH :match ORDER BY rowid LIMIT :candidates) s "
+        "JOIN users u ON u.id = s.rowid LEFT JOIN user_profile p ON p.user_id = u.id "
+        "ORDER BY s.rank LIMIT :limit"),
+        {"match": match, "candidates": USER_SEARCH_CANDIDATES, "limit": USER_SEARCH_LIMIT})
+    return rows.all()
+
+def search_users_postgres(query):
+    escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    prefix = escaped + '%'
+    rows = (db.session.query(User.username, UserProfile.name, UserProfile.profile_pic)
+            .outerjoin(UserProfile, UserProfile.user_id == User.id))
+    if len(query) < USER_SEARCH_TRIGRAM_MIN:
+        # Kurze Präfixe nur über den Benutzernamen: Btree in C-Collation liefert
+        # Präfix-Bereich und Sortierung, LIMIT bricht nach 10 Treffern ab
+        username = db.func.lower(User.username).collate('C')
+        return rows.filter(username.like(prefix, escape='\\')).order_by(username).limit(USER_SEARCH_LIMIT).all()
+    rows = (rows
+            .filter(or_(User.username.ilike(prefix, escape='\\'),
+                        UserProfile.name.ilike(prefix, escape='\\'),
+                        UserProfile.name.ilike('% ' + prefix, escape='\\')))
+            .order_by(db.func.length(User.username))
+            .limit(USER_SEARCH_LIMIT))
+    return rows.all()
+
+@lru_cache(maxsize=1024)
+def search_users_cached(query, time_bucket):
+    # time_bucket begrenzt, wie lange andere Gunicorn-Worker veraltete Treffer liefern
+    rows = search_users_sqlite(query) if is_sqlite() else search_users_postgres(query)
+    return tuple({"username": username, "name": name,
+                  "url": url_for('user_profile', username=username),
+                  "profile_pic": url_for('static', filename='profile_pics/' + (profile_pic or 'default.png'))}
+                 for username, name, profile_pic in rows)
+
+def search_users(query):
+    query = ' '.join(query.lower().split())[:USER_SEARCH_MAX_QUERY]
+    if not query:
+        return ()
+    return search_users_cached(query, int(time.time() // USER_SEARCH_CACHE_SECONDS))
+
+# --- Sync Helpers ---
+SYNC_MODELS = {
+    'workouts': (Workout, ['id', 'exercise', 'date', 'type']),
+    'sets': (Set, ['id', 'workout_id', 'reps', 'weight']),
+    'user_stats': (UserStat, ['user_id', 'xp_total', 'streak_days', 'attr_strength', 'attr_endurance', 'attr_intelligence', 'coins']),
+    'notifications': (Notification, ['id', 'title', 'content', 'type', 'is_read', 'created_at']),
+}
+SYNC_MODEL_TABLES = {model: table for table, (model, _) in SYNC_MODELS.items()}
+SYNC_PAGE_SIZE = 500
+SYNC_MAX_OPERATIONS = 200
+
+def allocate_sync_seqs(connection, count):
+    # Das UPDATE sperrt die Zähler-Zeile bis zum Commit. Dadurch werden Nummern in
+    # Commit-Reihenfolge vergeben und ein Client-Cursor überspringt keine Änderung.
+    result = connection.execute(
+        db.update(SyncState).where(SyncState.id == 1).values(seq=SyncState.seq + count))
+    if result.rowcount == 0:
+        connection.execute(db.insert(SyncState).values(id=1, seq=count))
+    last = connection.execute(db.select(SyncState.seq).where(SyncState.id == 1)).scalar()
+    return iter(range(last - count + 1, last + 1))
+
+@event.listens_for(db.session, 'before_flush')
+def assign_sync_seqs(session, flush_context, instances):
+    changed = [obj for obj in session.new if type(obj) in SYNC_MODEL_TABLES]
+    changed += [obj for obj in session.dirty
+                if type(obj) in SYNC_MODEL_TABLES and session.is_modified(obj)]
+    deleted = [obj for obj in session.deleted if type(obj) in SYNC_MODEL_TABLES]
+    if not changed and not deleted:
+        return
+    seqs = allocate_sync_seqs(session.connection(), len(changed) + len(deleted))
+    for obj in changed:
+        obj.sync_seq = next(seqs)
+    for obj in deleted:
+        row_id = obj.user_id if isinstance(obj, UserStat) else obj.id
+        session.add(SyncTombstone(user_id=obj.user_id, table_name=SYNC_MODEL_TABLES[type(obj)],
+                                  row_id=row_id, sync_seq=next(seqs)))
+
+def serialize_sync_row(obj, columns):
+    data = {}
+    for column in columns:
+        value = getattr(obj, column)
+        data[column] = value.isoformat() if isinstance(value, datetime) else value
+    return data
+
+def get_sync_changes(user_id, cursor):
+    # Jede Tabelle liefert höchstens SYNC_PAGE_SIZE Zeilen. Da die Nummern global
+    # eindeutig sind, sind die ersten SYNC_PAGE_SIZE der Vereinigung lückenlos.
+    # Upserts und Löschungen kommen in einer Liste nach sync_seq, der Client muss sie
+    # in dieser Reihenfolge anwenden.
+    changes = []
+    for table, (model, columns) in SYNC_MODELS.items():
+        query = model.query.filter(model.user_id == user_id, model.sync_seq > cursor)
+        for obj in query.order_by(model.sync_seq).limit(SYNC_PAGE_SIZE + 1):
+            changes.append({"seq": obj.sync_seq, "table": table, "op": "upsert",
+                            "row": serialize_sync_row(obj, columns)})
+    tombstones = SyncTombstone.query.filter(SyncTombstone.user_id == user_id, SyncTombstone.sync_seq > cursor)
+    for t in tombstones.order_by(SyncTombstone.sync_seq).limit(SYNC_PAGE_SIZE + 1):
+        changes.append({"seq": t.sync_seq, "table": t.table_name, "op": "delete", "id": t.row_id})
+    changes.sort(key=lambda change: change["seq"])
+    has_more = len(changes) > SYNC_PAGE_SIZE
+    changes = changes[:SYNC_PAGE_SIZE]
+    new_cursor = changes[-1]["seq"] if changes else cursor
+    return changes, new_cursor, has_more
+
+def resolve_sync_workout_id(user_id, op):
+    # Offline angelegte Workouts haben noch keine ID und werden über den
+    # Idempotency-Key ihrer create_workout-Operation referenziert.
+    workout_id = op.get('workout_id')
+    if workout_id is not None:
+        if not isinstance(workout_id, int) or isinstance(workout_id, bool):
+            raise ValueError('Ungültige Workout-ID')
+        return workout_id
+    workout_key = op.get('workout_key')
+    if workout_key is not None and not isinstance(workout_key, str):
+        raise ValueError('Ungültiger Workout-Key')
+    if workout_key:
+        done = SyncOperation.query.filter_by(user_id=user_id, key=workout_key).first()
+        if done and json.loads(done.result).get('workout_id') is not None:
+            return json.loads(done.result)['workout_id']
+    raise ValueError('Workout nicht gefunden')
+
+def apply_sync_operation(user_id, op):
+    # Läuft ohne eigenen Commit, run_sync_operation committet Operation und Key gemeinsam
+    kind = op.get('op')
+    if kind == 'create_workout':
+        workout, xp = create_workout(user_id, op.get('exercise'), op.get('date'), op.get('type'), op.get('sets', []),
+                                     commit=False)
+        return {"workout_id": workout.id, "xp": xp}
+    if kind == 'add_sets':
+        workout = Workout.query.get(resolve_sync_workout_id(user_id, op))
+        if not workout or workout.user_id != user_id:
+            raise ValueError('Workout nicht gefunden')
+        new_sets, xp = add_workout_sets(workout, op.get('sets', []), commit=False)
+        return {"workout_id": workout.id, "set_ids": [s.id for s in new_sets], "xp": xp}
+    if kind == 'delete_workout':
+        workout_id = resolve_sync_workout_id(user_id, op)
+        return {"workout_id": workout_id, "deleted": remove_workout(user_id, workout_id, commit=False)}
+    if kind == 'restday':
+        workout = create_restday(user_id, op.get('date'), commit=False)
+        return {"workout_id": workout.id}
+    raise ValueError(f'Unbekannte Operation: {kind}')
+
+def stored_sync_result(user_id, key):
+    done = SyncOperation.query.filter_by(user_id=user_id, key=key).first()
+    return dict(json.loads(done.result), key=key) if done else None
+
+def run_sync_operation(user_id, op):
+    if not isinstance(op, dict):
+        return {"status": "error", "error": 'Ungültige Operation'}
+    key = op.get('key')
+    if not key or not isinstance(key, str):
+        return {"status": "error", "error": 'Idempotency-Key fehlt'}
+    done = stored_sync_result(user_id, key)
+    if done:
+        return done
+    record = SyncOperation(user_id=user_id, key=key, result='{}')
+    try:
+        # Key zuerst reservieren: ein paralleler Sync mit demselben Key scheitert am
+        # Unique-Constraint, bevor er die Operation ein zweites Mal ausführt
+        db.session.add(record)
+        db.session.flush()
+        result = dict(apply_sync_operation(user_id, op), status="ok")
+    except sa_exc.IntegrityError:
+        db.session.rollback()
+        return stored_sync_result(user_id, key) or {"key": key, "status": "retry"}
+    except (ValueError, KeyError, TypeError) as e:
+        # Ungültige Operationen werden ebenfalls gespeichert, damit ein erneuter
+        # Versuch dasselbe Ergebnis liefert
+        db.session.rollback()
+        result = {"status": "error", "error": str(e)}
+        record = SyncOperation(user_id=user_id, key=key)
+        db.session.add(record)
+    except sa_exc.SQLAlchemyError:
+        # Datenbankfehler nicht speichern, der Client soll es erneut versuchen
+        db.session.rollback()
+        return {"key": key, "status": "retry"}
+    record.result = json.dumps(result)
+    try:
+        db.session.commit()
+    except sa_exc.IntegrityError:
+        db.session.rollback()
+        return stored_sync_result(user_id, key) or {"key": key, "status": "retry"}
+    return dict(result, key=key)
+
+# --- XP Re-Scoring ---
+# Berechnet xp_total und Attribute aller User aus Workouts/Sets, Shop-Käufen und
+# dem Anfangsbestand ('opening') neu, z.B. nach einer Formeländerung. Coins werden
+# nicht angefasst, weil Käufe vor Einführung des Ledgers nicht verzeichnet sind.
+RESCORE_CHUNK_USERS = 2000
+RESCORE_FIELDS = ['xp_total', 'attr_strength', 'attr_endurance']
+
+def score_workouts(w_ids, w_users, w_days, w_types, s_wids, s_reps, s_weights):
+    # Workouts sortiert nach (user, date, id), Sets sortiert nach (workout_id, id)
+    n = len(w_ids)
+    order = np.argsort(w_ids)
+    widx = order[np.searchsorted(w_ids[order], s_wids)]
+    volume = np.bincount(widx, weights=s_reps * s_weights, minlength=n)
+    reps_total = np.bincount(widx, weights=s_reps, minlength=n)
+    first_reps = np.zeros(n)
+    first_weight = np.zeros(n)
+    _, first = np.unique(s_wids, return_index=True)
+    first_reps[widx[first]] = s_reps[first]
+    first_weight[widx[first]] = s_weights[first]
+
+    # Streak pro Tag wie in user_streak: folgt der Tag direkt auf einen Trainingstag,
+    # zählt ein Trainingstag +1 und ein Ruhetag behält den Streak; sonst beginnt er neu
+    # (Training 1, Ruhetag 0). Der Bonus nutzt den Streak vor dem Tag.
+    new_day = np.ones(n, dtype=bool)
+    new_day[1:] = (w_users[1:] != w_users[:-1]) | (w_days[1:] != w_days[:-1])
+    day_idx = np.cumsum(new_day) - 1
+    d_users = w_users[new_day]
+    d_days = w_days[new_day]
+    d_trained = np.bincount(day_idx, weights=(w_types != 'restday'), minlength=len(d_days)) > 0
+    same_user = np.zeros(len(d_days), dtype=bool)
+    same_user[1:] = d_users[1:] == d_users[:-1]
+    cont = np.zeros(len(d_days), dtype=bool)
+    cont[1:] = same_user[1:] & (d_days[1:] - d_days[:-1] == 1) & d_trained[:-1]
+    # Innerhalb einer zusammenhängenden Folge = Anzahl Trainingstage seit ihrem Beginn
+    # (ein Ruhetag kann nur der letzte Tag einer Folge sein)
+    idx = np.arange(len(d_days))
+    run_start = np.maximum.accumulate(np.where(cont, 0, idx))
+    trained_cum = np.cumsum(d_trained)
+    streak_after = (trained_cum - trained_cum[run_start] + d_trained[run_start]).astype(np.int64)
+    streak_before = np.zeros(len(d_days), dtype=np.int64)
+    streak_before[1:] = np.where(same_user[1:], streak_after[:-1], 0)
+
+    xp = workout_xp(w_types, volume, reps_total, first_reps, first_weight, streak_bonus(streak_before)[day_idx])
+    attr_strength = np.isin(w_types, [t for t, a in WORKOUT_ATTRS.items() if a == 'attr_strength'])
+    attr_endurance = np.isin(w_types, [t for t, a in WORKOUT_ATTRS.items() if a == 'attr_endurance'])
+    return xp, attr_strength, attr_endurance
+
+def fetch_columns(statement, dtypes):
+    # Ergebnis spaltenweise als NumPy-Arrays, ohne ORM-Objekte
+    rows = db.session.connection().execute(statement).all()
+    columns = list(zip(*rows)) or [()] * len(dtypes)
+    return [np.array(column, dtype=dtype) for column, dtype in zip(columns, dtypes)]
+
+def rescore_chunk(lo, hi, dry_run, commit=True):
+    w_ids, w_users, w_days, w_types = fetch_columns(
+        db.select(Workout.id, Workout.user_id, Workout.date, Workout.type)
+        .where(Workout.user_id.between(lo, hi))
+        .order_by(Workout.user_id, Workout.date, Workout.id),
+        [np.int64, np.int64, 'datetime64[D]', object])
+    s_wids, s_reps, s_weights = fetch_columns(
+        db.select(Set.workout_id, Set.reps, Set.weight)
+        .join(Workout, Workout.id == Set.workout_id)
+        .where(Workout.user_id.between(lo, hi))
+        .order_by(Set.workout_id, Set.id),
+        [np.int64, np.float64, np.float64])
+    booked_xp = dict(db.session.execute(
+        db.select(XpLedger.user_id, db.func.sum(XpLedger.xp))
+        .where(XpLedger.user_id.between(lo, hi), XpLedger.source.in_(['shop', 'opening']))
+        .group_by(XpLedger.user_id)).all())
+    l_wids, *booked = fetch_columns(
+        db.select(XpLedger.workout_id, db.func.coalesce(db.func.sum(XpLedger.xp), 0),
+                  db.func.coalesce(db.func.sum(XpLedger.attr_strength), 0),
+                  db.func.coalesce(db.func.sum(XpLedger.attr_endurance), 0))
+        .where(XpLedger.user_id.between(lo, hi), XpLedger.workout_id.isnot(None))
+        .group_by(XpLedger.workout_id)
+        .order_by(XpLedger.workout_id),
+        [np.int64] * 4)
+    u_ids, *old = fetch_columns(
+        db.select(UserStat.user_id, db.func.coalesce(UserStat.xp_total, 0),
+                  db.func.coalesce(UserStat.attr_strength, 0), db.func.coalesce(UserStat.attr_endurance, 0))
+        .where(UserStat.user_id.between(lo, hi))
+        .order_by(UserStat.user_id),
+        [np.int64] * 4)
+    old = np.stack(old, axis=1)
+    xp, attr_strength, attr_endurance = score_workouts(w_ids, w_users, w_days.astype(np.int64), w_types,
+                                                       s_wids, s_reps, s_weights)
+
+    # Workouts den UserStat-Zeilen zuordnen (User ohne Stats-Zeile fallen raus)
+    uidx = np.minimum(np.searchsorted(u_ids, w_users), max(len(u_ids) - 1, 0))
+    known = (u_ids[uidx] == w_users) if len(u_ids) else np.zeros(len(w_users), dtype=bool)
+    new = np.stack([
+        np.bincount(uidx[known], weights=xp[known], minlength=len(u_ids)),
+        np.bincount(uidx[known], weights=attr_strength[known], minlength=len(u_ids)),
+        np.bincount(uidx[known], weights=attr_endurance[known], minlength=len(u_ids)),
+    ], axis=1).astype(np.int64)
+    new[:, 0] += np.array([booked_xp.get(int(u), 0) or 0 for u in u_ids], dtype=np.int64)
+
+    changed = np.flatnonzero((new != old).any(axis=1))
+    diffs = [{"user_id": int(u_ids[i]),
+              **{field: (int(old[i, j]), int(new[i, j])) for j, field in enumerate(RESCORE_FIELDS)}}
+             for i in changed]
+    if dry_run:
+        return diffs
+
+    # Differenz pro Workout als 'rescore'-Buchung, damit reverse_workout_xp beim Löschen
+    # den aktuellen Wert zurücknimmt. Was sich keinem Workout zuordnen lässt, bekommt
+    # eine Buchung ohne workout_id, damit Ledger-Summe und Stats übereinstimmen.
+    scored = np.stack([xp, attr_strength, attr_endurance], axis=1).astype(np.int64)[known]
+    scored_wids = w_ids[known]
+    booked = np.stack(booked, axis=1) if len(l_wids) else np.zeros((0, 3), dtype=np.int64)
+    lidx = np.minimum(np.searchsorted(l_wids, scored_wids), max(len(l_wids) - 1, 0))
+    hit = (l_wids[lidx] == scored_wids) if len(l_wids) else np.zeros(len(scored_wids), dtype=bool)
+    w_delta = scored.copy()
+    w_delta[hit] -= booked[lidx[hit]]
+    u_delta = (new - old) - np.stack([
+        np.bincount(uidx[known], weights=w_delta[:, j], minlength=len(u_ids)) for j in range(3)
+    ], axis=1).astype(np.int64)
+
+    now = datetime.utcnow()
+    entries = [{"user_id": int(w_users[known][i]), "workout_id": int(scored_wids[i]), "delta": w_delta[i]}
+               for i in np.flatnonzero(w_delta.any(axis=1))]
+    entries += [{"user_id": int(u_ids[i]), "workout_id": None, "delta": u_delta[i]}
+                for i in np.flatnonzero(u_delta.any(axis=1))]
+    if diffs:
+        seqs = allocate_sync_seqs(db.session.connection(), len(diffs))
+        db.session.execute(db.update(UserStat), [
+            dict({field: d[field][1] for field in RESCORE_FIELDS}, user_id=d['user_id'], sync_seq=next(seqs))
+            for d in diffs])
+    if entries:
+        db.session.execute(db.insert(XpLedger), [
+            {"user_id": e['user_id'], "workout_id": e['workout_id'], "source": 'rescore', "xp": int(e['delta'][0]),
+             "coins": 0, "attr_strength": int(e['delta'][1]), "attr_endurance": int(e['delta'][2]),
+             "created_at": now} for e in entries])
+    if commit:
+        db.session.commit()
+    return diffs
+
+def rescore_stats(dry_run=False, chunk_users=RESCORE_CHUNK_USERS):
+    user_ids = db.session.execute(db.select(UserStat.user_id).order_by(UserStat.user_id)).scalars().all()
+    diffs = []
+    for start in range(0, len(user_ids), chunk_users):
+        chunk = user_ids[start:start + chunk_users]
+        diffs += rescore_chunk(chunk[0], chunk[-1], dry_run)
+    return diffs
 
 def init_db():
     db.create_all()
+    ensure_user_search_index()
     if not User.query.filter_by(username='admin').first():
         admin_user = User(username='admin', password=hash_password('admin'), is_admin=True)
         db.session.add(admin_user)
@@ -260,6 +913,7 @@ def register():
         db.session.commit()
         db.session.add(UserProfile(user_id=user.id))
         db.session.add(UserStat(user_id=user.id))
+        index_user_search(user.id, user.username, None)
         db.session.commit()
         return redirect(url_for('login'))
     return render_template('register.html')
@@ -302,7 +956,7 @@ def user_profile(username):
     level, xp_remaining, xp_for_next = calculate_level(stats.xp_total)
     rank_name = get_rank_name(level)
     kraft = stats.attr_strength
-    recent_workouts = Workout.query.filter_by(user_id=target_user.id).order_by(Workout.date.desc()).limit(5).all()
+    recent_workouts, next_cursor = get_workout_history(target_user.id, limit=5)
     for w in recent_workouts:
         w.sets_count = len(w.sets)
         if w.type == 'cardio' and w.sets:
@@ -310,7 +964,7 @@ def user_profile(username):
             w.distance = w.sets[0].weight
     return render_template('user_profile.html', target_user=target_user, profile=profile, stats=stats, level=level,
                            rank_name=rank_name, xp_remaining=xp_remaining, xp_for_next=xp_for_next, kraft=kraft,
-                           recent_workouts=recent_workouts)
+                           recent_workouts=recent_workouts, next_cursor=next_cursor)
 
 @app.route('/update_profile', methods=['POST'])
 def update_profile():
@@ -329,6 +983,7 @@ def update_profile():
             filename = secure_filename(file.filename)
             file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
             profile.profile_pic = filename
+    index_user_search(profile.user_id, session['username'], profile.name)
     db.session.commit()
     flash('Profil aktualisiert', 'success')
     return redirect(url_for('profile'))
@@ -353,25 +1008,9 @@ def add_workout():
     if 'user_id' not in session:
         return redirect(url_for('login'))
     try:
-        exercise = request.form['exercise']
-        date = request.form['date']
-        w_type = request.form['type']
-        if not exercise or not date or not w_type:
-            flash('Alle Felder ausfüllen', 'error')
-            return redirect(url_for('workout_page'))
-        if Workout.query.filter_by(user_id=session['user_id'], date=date, exercise=exercise).first():
-            flash('Workout bereits eingetragen', 'error')
-            return redirect(url_for('workout_page'))
-        workout = Workout(user_id=session['user_id'], exercise=exercise, date=date, type=w_type)
-        db.session.add(workout)
-        db.session.commit()
         sets_data = json.loads(request.form.get('sets', '[]'))
-        for s in sets_data:
-            new_set = Set(workout_id=workout.id, user_id=session['user_id'], reps=s['reps'], weight=s['weight'])
-            db.session.add(new_set)
-        db.session.commit()
-        xp = calculate_xp(workout, workout.sets)
-        update_streak(session['user_id'], date)
+        workout, xp = create_workout(session['user_id'], request.form['exercise'], request.form['date'],
+                                     request.form['type'], sets_data)
         flash(f'Workout hinzugefügt! +{xp} XP', 'success')
     except Exception as e:
         db.session.rollback()
@@ -383,30 +1022,8 @@ def add_restday():
     if 'user_id' not in session:
         return redirect(url_for('login'))
     try:
-        date = request.form['date']
-        if Workout.query.filter_by(user_id=session['user_id'], date=date).first():
-            flash('Datum hat bereits ein Workout', 'error')
-            return redirect(url_for('workout_page'))
-        today = datetime.now(pytz.utc).date()
-        yesterday = today - timedelta(days=1)
-        day_before = today - timedelta(days=2)
-        yesterday_date = yesterday.strftime("%Y-%m-%d")
-        day_before_date = day_before.strftime("%Y-%m-%d")
-        yesterday_workout = Workout.query.filter_by(user_id=session['user_id'], date=yesterday_date).first()
-        day_before_workout = Workout.query.filter_by(user_id=session['user_id'], date=day_before_date).first()
-        yesterday_restday = yesterday_workout and yesterday_workout.exercise == 'Restday'
-        if day_before_workout and yesterday_workout and not yesterday_restday:
-            workout = Workout(user_id=session['user_id'], exercise='Restday', date=date, type='restday')
-            db.session.add(workout)
-            db.session.commit()
-            update_streak(session['user_id'], date, is_restday=True)
-            flash('Ruhetag eingetragen', 'success')
-        elif not day_before_workout or not yesterday_workout:
-            flash('Ruhetag nur nach mindestens 2 Trainings möglich', 'error')
-        elif yesterday_restday:
-            flash('Keine zwei Ruhetage in Folge', 'error')
-        else:
-            flash('Ruhetag nicht verfügbar', 'error')
+        create_restday(session['user_id'], request.form['date'])
+        flash('Ruhetag eingetragen', 'success')
     except Exception as e:
         db.session.rollback()
         flash(str(e), 'error')
@@ -416,23 +1033,41 @@ def add_restday():
 def delete_workout(workout_id):
     if 'user_id' not in session:
         return redirect(url_for('login'))
-    workout = Workout.query.get(workout_id)
-    if workout and workout.user_id == session['user_id']:
-        db.session.delete(workout)
-        db.session.commit()
+    if remove_workout(session['user_id'], workout_id):
         flash('Workout gelöscht', 'success')
     return redirect(url_for('workout_page'))
 
+@app.route('/api/sync', methods=['POST'])
+def api_sync():
+    # Offline-Clients schicken ihre gesammelten Operationen und bekommen alle
+    # Änderungen seit ihrem letzten Cursor zurück
+    if 'user_id' not in session:
+        return jsonify({"error": "Nicht eingeloggt"}), 401
+    data = request.get_json(silent=True) or {}
+    operations = data.get('operations', [])
+    try:
+        cursor = int(data.get('cursor') or 0)
+    except (TypeError, ValueError):
+        return jsonify({"error": "Ungültiger Cursor"}), 400
+    if not isinstance(operations, list) or len(operations) > SYNC_MAX_OPERATIONS:
+        return jsonify({"error": f"Maximal {SYNC_MAX_OPERATIONS} Operationen pro Sync"}), 400
+    results = [run_sync_operation(session['user_id'], op) for op in operations]
+    changes, new_cursor, has_more = get_sync_changes(session['user_id'], cursor)
+    return jsonify({"results": results, "changes": changes, "cursor": new_cursor, "has_more": has_more})
+
 @app.route('/fitness-kalendar')
 def fitness_kalendar():
     if 'user_id' not in session:
         return redirect(url_for('login'))
     try:
-        workouts = Workout.query.filter_by(user_id=session['user_id']).order_by(Workout.date.desc()).all()
-        all_dates = set()
-        workout_dates = set()
         today = datetime.now(pytz.utc).date()
         thirty_days_ago = today - timedelta(days=30)
+        workouts = (Workout.query.filter(Workout.user_id == session['user_id'],
+                                         Workout.date >= thirty_days_ago.strftime("%Y-%m-%d"))
+                    .options(selectinload(Workout.sets))
+                    .order_by(Workout.date.desc()).all())
+        all_dates = set()
+        workout_dates = set()
         for workout in workouts:
             workout_date = datetime.strptime(workout.date, "%Y-%m-%d").date()
             if thirty_days_ago <= workout_date <= today:
@@ -456,25 +1091,7 @@ def fitness_kalendar():
         workout_date = datetime.strptime(workout_item.date, "%Y-%m-%d")
         display_date = workout_date.strftime("%d.%m.%Y")
         if thirty_days_ago <= workout_date.date() <= today:
-            workout_data = {
-                "id": workout_item.id,
-                "exercise": workout_item.exercise,
-                "type": workout_item.type
-            }
-            if workout_item.type == "cardio":
-                if workout_item.sets:
-                    cardio_set = workout_item.sets[0]
-                    workout_data["duration"] = cardio_set.reps
-                    workout_data["distance"] = cardio_set.weight
-                else:
-                    workout_data["duration"] = 0
-                    workout_data["distance"] = 0
-            elif workout_item.type == "calisthenics":
-                workout_data["sets"] = [{"reps": s.reps, "weight": s.weight} for s in workout_item.sets]
-                workout_data["bodyweight"] = workout_item.sets[0].weight if workout_item.sets else 0
-            else:
-                workout_data["sets"] = [{"reps": s.reps, "weight": s.weight} for s in workout_item.sets]
-            grouped_workouts[display_date].append(workout_data)
+            grouped_workouts[display_date].append(workout_to_dict(workout_item))
     for date, rest_workouts in rest_days.items():
         if date in grouped_workouts:
             grouped_workouts[date].extend(rest_workouts)
@@ -483,6 +1100,50 @@ def fitness_kalendar():
     sorted_workouts = sorted(grouped_workouts.items(), key=lambda item: datetime.strptime(item[0], "%d.%m.%Y"), reverse=True)
     return render_template("fitness-kalendar.html", workouts=dict(sorted_workouts))
 
+@app.route('/history')
+def history():
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+    username = request.args.get('username') or session['username']
+    target_user = User.query.filter_by(username=username).first()
+    if not target_user:
+        flash('User nicht gefunden', 'error')
+        return redirect(url_for('index'))
+    w_type = request.args.get('type') or None
+    exercise = request.args.get('exercise') or None
+    workouts, next_cursor = get_workout_history(target_user.id, w_type=w_type, exercise=exercise)
+    return render_template('history.html', target_user=target_user, workouts=workouts, next_cursor=next_cursor,
+                           w_type=w_type, exercise=exercise)
+
+@app.route('/api/history')
+def api_history():
+    if 'user_id' not in session:
+        return jsonify({"error": "Nicht eingeloggt"}), 401
+    username = request.args.get('username')
+    user_id = session['user_id']
+    if username:
+        target_user = User.query.filter_by(username=username).first()
+        if not target_user:
+            return jsonify({"error": "User nicht gefunden"}), 404
+        user_id = target_user.id
+    limit = min(max(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), 1), HISTORY_MAX_PAGE_SIZE)
+    try:
+        workouts, next_cursor = get_workout_history(user_id, cursor=request.args.get('cursor'), limit=limit,
+                                                    w_type=request.args.get('type') or None,
+                                                    exercise=request.args.get('exercise') or None)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({
+        "workouts": [dict(workout_to_dict(w), date=w.date) for w in workouts],
+        "next_cursor": next_cursor
+    })
+
+@app.route('/api/users/search')
+def api_user_search():
+    if 'user_id' not in session:
+        return jsonify({"error": "Nicht eingeloggt"}), 401
+    return jsonify({"users": list(search_users(request.args.get('q', '')))})
+
 @app.route('/shop')
 def shop():
     if 'user_id' not in session:
@@ -499,10 +1160,13 @@ def buy_item(item_id):
     stats = UserStat.query.filter_by(user_id=session['user_id']).first()
     if item and stats.coins >= item.price:
         stats.coins -= item.price
+        xp = 0
         if item.effect == 'xp_boost_50':
-            stats.xp_total += 50
+            xp = 50
+            stats.xp_total += xp
         elif item.effect == 'streak_protect':
             pass  # Implementiere Streak-Schutz
+        db.session.add(XpLedger(user_id=stats.user_id, source='shop', xp=xp, coins=-item.price))
         db.session.commit()
         flash(f'{item.name} gekauft!', 'success')
     else:
@@ -545,6 +1209,21 @@ def backup_db():
     repo.create_file("backup.db", "DB Backup", content, branch=app.config['GITHUB_BRANCH'])
     return 'Backup successful'
 
+# CLI
+@app.cli.command('rescore')
+@click.option('--dry-run', is_flag=True, help='Nur Unterschiede anzeigen, nichts schreiben.')
+@click.option('--chunk-users', default=RESCORE_CHUNK_USERS, show_default=True, help='User pro Durchlauf.')
+def rescore_command(dry_run, chunk_users):
+    """Berechnet XP und Attribute aller User neu."""
+    started = time.perf_counter()
+    diffs = rescore_stats(dry_run=dry_run, chunk_users=chunk_users)
+    for d in diffs:
+        changes = ', '.join(f"{field}: {d[field][0]} -> {d[field][1]}" for field in RESCORE_FIELDS
+                            if d[field][0] != d[field][1])
+        click.echo(f"User {d['user_id']}: {changes}")
+    mode = 'würden geändert (dry run)' if dry_run else 'geändert'
+    click.echo(f"{len(diffs)} User {mode} in {time.perf_counter() - started:.1f}s")
+
 # Jinja Filters
 @app.template_filter('xpformat')
 def xpformat(value):
@@ -0,0 +1,74 @@
+"""sync cursor columns, tombstones and idempotency keys
+
+Revision ID: 3c9f1a7d2b64
+Revises: 17a1eb17c63b
+Create Date: 2026-10-19 10:12:31.418220
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9f1a7d2b64'
+down_revision = '17a1eb17c63b'
+branch_labels = None
+depends_on = None
+
+SYNC_TABLES = [('workouts', 'id'), ('sets', 'id'), ('user_stats', 'user_id'), ('notifications', 'id')]
+
+
+def upgrade():
+    op.create_table('sync_state',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('seq', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('sync_tombstones',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('table_name', sa.Text(), nullable=False),
+    sa.Column('row_id', sa.Integer(), nullable=False),
+    sa.Column('sync_seq', sa.BigInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('sync_tombstones', schema=None) as batch_op:
+        batch_op.create_index('ix_sync_tombstones_user_sync', ['user_id', 'sync_seq'], unique=False)
+
+    op.create_table('sync_operations',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('key', sa.Text(), nullable=False),
+    sa.Column('result', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'key', name='uq_sync_operations_user_key')
+    )
+
+    # Bestehende Zeilen bekommen eindeutige Nummern, damit der erste Sync
+    # (Cursor 0) sie vollständig und seitenweise ausliefert
+    conn = op.get_bind()
+    offset = 0
+    for table, pk in SYNC_TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('sync_seq', sa.BigInteger(), nullable=True))
+            batch_op.create_index(f'ix_{table}_user_sync', ['user_id', 'sync_seq'], unique=False)
+        conn.execute(sa.text(f'UPDATE {table} SET sync_seq = {pk} + :offset'), {'offset': offset})
+        offset += conn.execute(sa.text(f'SELECT COALESCE(MAX({pk}), 0) FROM {table}')).scalar()
+    conn.execute(sa.text('INSERT INTO sync_state (id, seq) VALUES (1, :seq)'), {'seq': offset})
+
+
+def downgrade():
+    for table, _ in reversed(SYNC_TABLES):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_index(f'ix_{table}_user_sync')
+            batch_op.drop_column('sync_seq')
+
+    op.drop_table('sync_operations')
+    with op.batch_alter_table('sync_tombstones', schema=None) as batch_op:
+        batch_op.drop_index('ix_sync_tombstones_user_sync')
+
+    op.drop_table('sync_tombstones')
+    op.drop_table('sync_state')
@@ -0,0 +1,26 @@
+"""workouts (user_id, date, id) index for keyset history pagination
+
+Revision ID: 8e21d5b4f0a3
+Revises: 3c9f1a7d2b64
+Create Date: 2026-10-19 11:47:05.902114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e21d5b4f0a3'
+down_revision = '3c9f1a7d2b64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('workouts', schema=None) as batch_op:
+        batch_op.create_index('ix_workouts_user_date_id', ['user_id', 'date', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('workouts', schema=None) as batch_op:
+        batch_op.drop_index('ix_workouts_user_date_id')
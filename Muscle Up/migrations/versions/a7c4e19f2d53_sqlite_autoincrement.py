@@ -0,0 +1,44 @@
+"""AUTOINCREMENT for synced tables on SQLite
+
+Revision ID: a7c4e19f2d53
+Revises: f3a8c61d9b27
+Create Date: 2026-10-20 09:21:05.631874
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c4e19f2d53'
+down_revision = 'f3a8c61d9b27'
+branch_labels = None
+depends_on = None
+
+AUTOINCREMENT_TABLES = ['workouts', 'sets', 'notifications']
+
+
+def upgrade():
+    # Ohne AUTOINCREMENT vergibt SQLite die höchste gelöschte ID neu, Sync-Clients und
+    # xp_ledger.workout_id verwechseln die neue Zeile dann mit der gelöschten
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for table in AUTOINCREMENT_TABLES:
+        with op.batch_alter_table(table, recreate='always', table_kwargs={'sqlite_autoincrement': True}):
+            pass
+        # Auch IDs, die vor der Migration oberhalb der höchsten vorhandenen gelöscht wurden, nicht neu vergeben
+        used = ["(SELECT max(id) FROM {})".format(table),
+                "(SELECT max(row_id) FROM sync_tombstones WHERE table_name = :table)"]
+        if table == 'workouts':
+            used.append("(SELECT max(workout_id) FROM xp_ledger)")
+        op.execute(sa.text("DELETE FROM sqlite_sequence WHERE name = :table").bindparams(table=table))
+        op.execute(sa.text("INSERT INTO sqlite_sequence (name, seq) SELECT :table, max({})".format(
+            ', '.join(f"coalesce({u}, 0)" for u in used))).bindparams(table=table))
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for table in AUTOINCREMENT_TABLES:
+        with op.batch_alter_table(table, recreate='always', table_kwargs={'sqlite_autoincrement': False}):
+            pass
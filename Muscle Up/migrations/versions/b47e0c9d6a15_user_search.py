@@ -0,0 +1,37 @@
+"""user search index (FTS5 on SQLite, pg_trgm on Postgres)
+
+Revision ID: b47e0c9d6a15
+Revises: 8e21d5b4f0a3
+Create Date: 2026-10-19 13:21:44.650391
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b47e0c9d6a15'
+down_revision = '8e21d5b4f0a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS user_search "
+                   "USING fts5(username, name, tokenize='unicode61', prefix='1 2 3')")
+        op.execute("INSERT INTO user_search (rowid, username, name) "
+                   "SELECT u.id, u.username, COALESCE(p.name, '') FROM users u "
+                   "LEFT JOIN user_profile p ON p.user_id = u.id")
+    else:
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute("CREATE INDEX IF NOT EXISTS ix_users_username_trgm ON users USING gin (username gin_trgm_ops)")
+        op.execute("CREATE INDEX IF NOT EXISTS ix_user_profile_name_trgm ON user_profile USING gin (name gin_trgm_ops)")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute("DROP TABLE IF EXISTS user_search")
+    else:
+        op.execute("DROP INDEX IF EXISTS ix_user_profile_name_trgm")
+        op.execute("DROP INDEX IF EXISTS ix_users_username_trgm")
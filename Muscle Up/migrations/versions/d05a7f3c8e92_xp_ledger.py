@@ -0,0 +1,43 @@
+"""xp ledger
+
+Revision ID: d05a7f3c8e92
+Revises: b47e0c9d6a15
+Create Date: 2026-10-19 15:02:18.337460
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd05a7f3c8e92'
+down_revision = 'b47e0c9d6a15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('xp_ledger',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('workout_id', sa.Integer(), nullable=True),
+    sa.Column('source', sa.Text(), nullable=False),
+    sa.Column('xp', sa.Integer(), nullable=True),
+    sa.Column('coins', sa.Integer(), nullable=True),
+    sa.Column('attr_strength', sa.Integer(), nullable=True),
+    sa.Column('attr_endurance', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('xp_ledger', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_xp_ledger_user_id'), ['user_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_xp_ledger_workout_id'), ['workout_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('xp_ledger', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_xp_ledger_workout_id'))
+        batch_op.drop_index(batch_op.f('ix_xp_ledger_user_id'))
+
+    op.drop_table('xp_ledger')
@@ -0,0 +1,27 @@
+"""btree on lower(username) for short user search prefixes (Postgres)
+
+Revision ID: e61b2a9c4f07
+Revises: d05a7f3c8e92
+Create Date: 2026-10-19 17:40:12.514308
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e61b2a9c4f07'
+down_revision = 'd05a7f3c8e92'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # pg_trgm grenzt Präfixe unter 3 Zeichen nicht ein; SQLite nutzt den FTS5-Präfixindex
+    if op.get_bind().dialect.name != 'sqlite':
+        op.execute('CREATE INDEX IF NOT EXISTS ix_users_username_lower_c ON users (lower(username) COLLATE "C")')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        op.execute("DROP INDEX IF EXISTS ix_users_username_lower_c")
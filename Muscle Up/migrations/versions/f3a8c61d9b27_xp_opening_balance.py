@@ -0,0 +1,132 @@
+"""xp ledger backfill for existing workouts and opening balance
+
+Revision ID: f3a8c61d9b27
+Revises: e61b2a9c4f07
+Create Date: 2026-10-19 19:12:47.902215
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a8c61d9b27'
+down_revision = 'e61b2a9c4f07'
+branch_labels = None
+depends_on = None
+
+CHUNK_USERS = 2000
+WORKOUT_COINS = 10
+
+workouts = sa.table('workouts', sa.column('id', sa.Integer), sa.column('user_id', sa.Integer),
+                    sa.column('date', sa.Text), sa.column('type', sa.Text))
+sets = sa.table('sets', sa.column('id', sa.Integer), sa.column('workout_id', sa.Integer),
+                sa.column('reps', sa.Integer), sa.column('weight', sa.Float))
+user_stats = sa.table('user_stats', sa.column('user_id', sa.Integer), sa.column('xp_total', sa.Integer),
+                      sa.column('coins', sa.Integer))
+xp_ledger = sa.table('xp_ledger', sa.column('user_id', sa.Integer), sa.column('workout_id', sa.Integer),
+                     sa.column('source', sa.Text), sa.column('xp', sa.Integer), sa.column('coins', sa.Integer),
+                     sa.column('attr_strength', sa.Integer), sa.column('attr_endurance', sa.Integer),
+                     sa.column('created_at', sa.DateTime))
+
+
+def workout_xp(w_type, workout_sets, bonus):
+    # XP-Formel zum Zeitpunkt dieser Migration (workout_xp/streak_bonus in app.py),
+    # bewusst kopiert, damit spätere Formeländerungen diese Buchungen nicht verändern
+    if w_type == 'strength':
+        xp = sum(reps * weight for reps, weight in workout_sets) / 10 + bonus
+    elif w_type == 'cardio':
+        xp = (workout_sets[0][0] * 2 + workout_sets[0][1] * 10 if workout_sets else 0) + bonus
+    elif w_type == 'calisthenics':
+        xp = sum(reps for reps, _ in workout_sets) * 1.5 + bonus
+    else:
+        xp = 0
+    return int(xp)
+
+
+def score_user(user_workouts, sets_by_workout):
+    # Workouts eines Users nach (date, id); Streak-Regel wie score_workouts in app.py
+    scored = {}
+    streak, prev_day, prev_trained = 0, None, False
+    days = {}
+    for workout_id, date, w_type in user_workouts:
+        days.setdefault(date, []).append((workout_id, w_type))
+    for date in sorted(days):
+        bonus = 0 if streak < 3 else streak * 10
+        for workout_id, w_type in days[date]:
+            scored[workout_id] = (workout_xp(w_type, sets_by_workout.get(workout_id, []), bonus),
+                                  0 if w_type == 'restday' else WORKOUT_COINS,
+                                  int(w_type == 'strength'), int(w_type in ('cardio', 'calisthenics')))
+        day = datetime.strptime(date, "%Y-%m-%d").date()
+        trained = any(w_type != 'restday' for _, w_type in days[date])
+        cont = prev_day is not None and (day - prev_day).days == 1 and prev_trained
+        if trained:
+            streak = streak + 1 if cont else 1
+        elif not cont:
+            streak = 0
+        prev_day, prev_trained = day, trained
+    return scored
+
+
+def upgrade():
+    # Workouts von vor dem Ledger bekommen eine 'workout'-Buchung, damit delete_workout
+    # sie zurückbucht und flask rescore sie pro Workout vergleicht. Was danach an XP und
+    # Coins nicht durch den Ledger erklärt ist (z.B. XP-Boosts von vor dem Ledger), wird
+    # als 'opening' gebucht und von flask rescore beibehalten.
+    conn = op.get_bind()
+    now = datetime.utcnow()
+    user_ids = conn.execute(sa.select(user_stats.c.user_id).order_by(user_stats.c.user_id)).scalars().all()
+    for start in range(0, len(user_ids), CHUNK_USERS):
+        lo, hi = user_ids[start], user_ids[min(start + CHUNK_USERS, len(user_ids)) - 1]
+        by_user = {}
+        for workout_id, user_id, date, w_type in conn.execute(
+                sa.select(workouts.c.id, workouts.c.user_id, workouts.c.date, workouts.c.type)
+                .where(workouts.c.user_id.between(lo, hi))
+                .order_by(workouts.c.user_id, workouts.c.date, workouts.c.id)):
+            by_user.setdefault(user_id, []).append((workout_id, date, w_type))
+        sets_by_workout = {}
+        for workout_id, reps, weight in conn.execute(
+                sa.select(sets.c.workout_id, sets.c.reps, sets.c.weight)
+                .join(workouts, workouts.c.id == sets.c.workout_id)
+                .where(workouts.c.user_id.between(lo, hi))
+                .order_by(sets.c.workout_id, sets.c.id)):
+            sets_by_workout.setdefault(workout_id, []).append((reps, weight))
+        booked_workouts = set(conn.execute(
+            sa.select(xp_ledger.c.workout_id).distinct()
+            .where(xp_ledger.c.user_id.between(lo, hi), xp_ledger.c.workout_id.isnot(None))).scalars())
+        booked = {user_id: (xp, coins) for user_id, xp, coins in conn.execute(
+            sa.select(xp_ledger.c.user_id, sa.func.coalesce(sa.func.sum(xp_ledger.c.xp), 0),
+                      sa.func.coalesce(sa.func.sum(xp_ledger.c.coins), 0))
+            .where(xp_ledger.c.user_id.between(lo, hi))
+            .group_by(xp_ledger.c.user_id))}
+        stats = conn.execute(
+            sa.select(user_stats.c.user_id, sa.func.coalesce(user_stats.c.xp_total, 0),
+                      sa.func.coalesce(user_stats.c.coins, 0))
+            .where(user_stats.c.user_id.between(lo, hi))).all()
+
+        rows = []
+        for user_id, xp_total, coins in stats:
+            ledger_xp, ledger_coins = booked.get(user_id, (0, 0))
+            scored = score_user(by_user.get(user_id, []), sets_by_workout)
+            for workout_id, (xp, workout_coins, strength, endurance) in scored.items():
+                if workout_id in booked_workouts or not (xp or workout_coins or strength or endurance):
+                    continue
+                rows.append({'user_id': user_id, 'workout_id': workout_id, 'source': 'workout', 'xp': xp,
+                             'coins': workout_coins, 'attr_strength': strength, 'attr_endurance': endurance,
+                             'created_at': now})
+                ledger_xp += xp
+                ledger_coins += workout_coins
+            if xp_total != ledger_xp or coins != ledger_coins:
+                rows.append({'user_id': user_id, 'workout_id': None, 'source': 'opening',
+                             'xp': xp_total - ledger_xp, 'coins': coins - ledger_coins,
+                             'attr_strength': 0, 'attr_endurance': 0, 'created_at': now})
+        if rows:
+            op.bulk_insert(xp_ledger, rows)
+
+
+def downgrade():
+    # Die nachgetragenen 'workout'-Buchungen bleiben stehen, ein erneutes Upgrade
+    # überspringt Workouts mit Ledger-Einträgen und bucht sie nicht doppelt
+    op.execute(xp_ledger.delete().where(xp_ledger.c.source == 'opening'))